@@ -1,55 +1,88 @@
 import os
-from pydantic_settings import BaseSettings
-from dotenv import load_dotenv
-
-load_dotenv() # Load variables from .env file
-
-class Settings(BaseSettings):
-    supabase_url: str = os.getenv("SUPABASE_URL", "")
-    supabase_key: str = os.getenv("SUPABASE_KEY", "")
-    supabase_bucket_name: str = os.getenv("SUPABASE_BUCKET_NAME", "video-generator")
-    openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
-    dust_overlay_file_name: str = os.getenv("DUST_OVERLAY_FILE_NAME", "output.webm")
-    temp_dir_base: str = os.path.join(os.getcwd(), "temp-video-processing")
-    output_dir: str = os.path.join(os.getcwd(), "public", "generated-videos")
-    subtitle_font_file: str = os.getenv("SUBTITLE_FONT_FILE", "montserrat.ttf")
-    whisper_model: str = os.getenv("WHISPER_MODEL_NAME", "base")
-    
+from dataclasses import dataclass
+from dotenv import dotenv_values, find_dotenv
+
+# Snapshot the environment once; avoids repeated os.environ lookups below.
+# Values from .env are merged in without mutating os.environ (real env vars win, as with load_dotenv).
+# Set SKIP_DOTENV=1 where the env is injected by the orchestrator to skip locating and parsing .env.
+_ENV = os.environ.copy()
+if _ENV.get("SKIP_DOTENV") != "1":
+    _dotenv_path = find_dotenv()
+    if _dotenv_path:
+        _ENV = {**{k: v for k, v in dotenv_values(_dotenv_path).items() if v is not None}, **_ENV}
+
+# Typed readers: coerce env strings once, at import, into native int/float/bool values
+def _int(name: str, default: int) -> int:
+    value = _ENV.get(name)
+    return int(value) if value is not None else default
+
+def _float(name: str, default: float) -> float:
+    value = _ENV.get(name)
+    return float(value) if value is not None else default
+
+_TRUE_VALUES = frozenset(("1", "t", "true", "y", "yes", "on"))
+_FALSE_VALUES = frozenset(("0", "f", "false", "n", "no", "off"))
+
+def _bool(name: str, default: bool) -> bool:
+    value = _ENV.get(name)
+    if value is None:
+        return default
+    normalized = value.strip().lower()
+    if normalized in _TRUE_VALUES:
+        return True
+    if normalized in _FALSE_VALUES:
+        return False
+    raise ValueError(f"Invalid boolean value for {name}: {value!r}")
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    supabase_url: str = _ENV.get("SUPABASE_URL", "")
+    supabase_key: str = _ENV.get("SUPABASE_KEY", "")
+    supabase_bucket_name: str = _ENV.get("SUPABASE_BUCKET_NAME", "video-generator")
+    openai_api_key: str = _ENV.get("OPENAI_API_KEY", "")
+    dust_overlay_file_name: str = _ENV.get("DUST_OVERLAY_FILE_NAME", "output.webm")
+    temp_dir_base: str = _ENV.get("TEMP_DIR_BASE", os.path.join(os.getcwd(), "temp-video-processing"))
+    output_dir: str = _ENV.get("OUTPUT_DIR", os.path.join(os.getcwd(), "public", "generated-videos"))
+    download_cache_dir: str = _ENV.get("DOWNLOAD_CACHE_DIR", os.path.join(os.getcwd(), "download-cache"))
+    download_cache_max_mb: int = _int("DOWNLOAD_CACHE_MAX_MB", 0) # Opt-in image download cache; 0 (default) disables it
+    subtitle_font_file: str = _ENV.get("SUBTITLE_FONT_FILE", "montserrat.ttf")
+    whisper_model: str = _ENV.get("WHISPER_MODEL_NAME", "base")
+
     # Zoom settings
-    use_high_quality_zoom: bool = os.getenv("USE_HIGH_QUALITY_ZOOM", True)
-    hq_zoom_input_framerate: int = os.getenv("HQ_ZOOM_INPUT_FRAMERATE", 25)
-    hq_zoom_output_framerate: int = os.getenv("HQ_ZOOM_OUTPUT_FRAMERATE", 25)
-    hq_zoom_initial_scale: int = os.getenv("HQ_ZOOM_INITIAL_SCALE", 4000) # Width for initial upscale
+    use_high_quality_zoom: bool = _bool("USE_HIGH_QUALITY_ZOOM", True)
+    hq_zoom_input_framerate: int = _int("HQ_ZOOM_INPUT_FRAMERATE", 25)
+    hq_zoom_output_framerate: int = _int("HQ_ZOOM_OUTPUT_FRAMERATE", 25)
+    hq_zoom_initial_scale: int = _int("HQ_ZOOM_INITIAL_SCALE", 4000) # Width for initial upscale
     # Settings for alternating (ping-pong) zoom
-    hq_zoom_pingpong_increment: float = os.getenv("HQ_ZOOM_PINGPONG_INCREMENT", 0.0015)
-    hq_zoom_pingpong_duration_s: int = os.getenv("HQ_ZOOM_PINGPONG_DURATION_S", 20) # Duration for one direction (in or out)
-    hq_zoom_max_factor: float = os.getenv("HQ_ZOOM_MAX_FACTOR", 1.5) # Max zoom level (e.g., 1.5x)
+    hq_zoom_pingpong_increment: float = _float("HQ_ZOOM_PINGPONG_INCREMENT", 0.0015)
+    hq_zoom_pingpong_duration_s: int = _int("HQ_ZOOM_PINGPONG_DURATION_S", 20) # Duration for one direction (in or out)
+    hq_zoom_max_factor: float = _float("HQ_ZOOM_MAX_FACTOR", 1.5) # Max zoom level (e.g., 1.5x)
     # hq_zoom_increment is deprecated by hq_zoom_pingpong_increment if using alternating zoom
     # hq_zoom_max_scale is not directly used by zoompan z factor, hq_zoom_max_factor is used.
 
-    srt_max_words_per_line: int = os.getenv("SRT_MAX_WORDS_PER_LINE", 4)
-    
+    srt_max_words_per_line: int = _int("SRT_MAX_WORDS_PER_LINE", 4)
+
     # FFmpeg encoding settings
-    ffmpeg_preset: str = os.getenv("FFMPEG_PRESET", "ultrafast")
-    ffmpeg_crf: int = os.getenv("FFMPEG_CRF", 26)
-    ffmpeg_audio_bitrate: str = os.getenv("FFMPEG_AUDIO_BITRATE", "96k")
-    
+    ffmpeg_preset: str = _ENV.get("FFMPEG_PRESET", "ultrafast")
+    ffmpeg_crf: int = _int("FFMPEG_CRF", 26)
+    ffmpeg_audio_bitrate: str = _ENV.get("FFMPEG_AUDIO_BITRATE", "96k")
+    hw_encoder: str = _ENV.get("HW_ENCODER", "none") # none | nvenc | qsv | vt | vaapi
+    vaapi_device: str = _ENV.get("VAAPI_DEVICE", "/dev/dri/renderD128")
+    ffmpeg_max_parallel: int = _int("FFMPEG_MAX_PARALLEL", 2) # Concurrent FFmpeg renders per worker
+    ffmpeg_pin_cpus: bool = _bool("FFMPEG_PIN_CPUS", False) # Give each concurrent render its own CPU set (Linux, needs taskset)
+
     # Subtitle styling parameters
-    subtitle_font_size: str = os.getenv("SUBTITLE_FONT_SIZE", "24")
-    subtitle_primary_colour: str = os.getenv("SUBTITLE_PRIMARY_COLOUR", "&H00FFFFFF&")
-    subtitle_outline_colour: str = os.getenv("SUBTITLE_OUTLINE_COLOUR", "&H00000000&")
-    subtitle_border_style: str = os.getenv("SUBTITLE_BORDER_STYLE", "1")
-    subtitle_outline_thickness: str = os.getenv("SUBTITLE_OUTLINE_THICKNESS", "2.0")
-    subtitle_margin_v: str = os.getenv("SUBTITLE_MARGIN_V", "30")
-    subtitle_wrap_style: str = os.getenv("SUBTITLE_WRAP_STYLE", "2")
-    
-    # Target video properties
-    target_video_width: int = 1024
-    target_video_height: int = 720
-    target_fps: int = 30
+    subtitle_font_size: str = _ENV.get("SUBTITLE_FONT_SIZE", "24")
+    subtitle_primary_colour: str = _ENV.get("SUBTITLE_PRIMARY_COLOUR", "&H00FFFFFF&")
+    subtitle_outline_colour: str = _ENV.get("SUBTITLE_OUTLINE_COLOUR", "&H00000000&")
+    subtitle_border_style: str = _ENV.get("SUBTITLE_BORDER_STYLE", "1")
+    subtitle_outline_thickness: str = _ENV.get("SUBTITLE_OUTLINE_THICKNESS", "2.0")
+    subtitle_margin_v: str = _ENV.get("SUBTITLE_MARGIN_V", "30")
+    subtitle_wrap_style: str = _ENV.get("SUBTITLE_WRAP_STYLE", "2")
 
-    class Config:
-        env_file = '.env'
-        env_file_encoding = 'utf-8'
+    # Target video properties
+    target_video_width: int = _int("TARGET_VIDEO_WIDTH", 1024)
+    target_video_height: int = _int("TARGET_VIDEO_HEIGHT", 720)
+    target_fps: int = _int("TARGET_FPS", 30)
 
-settings = Settings() 
\ No newline at end of file
+settings = Settings()
\ No newline at end of file
@@ -1,26 +1,53 @@
 from fastapi import FastAPI, BackgroundTasks, HTTPException, status
-from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import logging
 import uuid
+from contextlib import asynccontextmanager
 
-from models.video import CreateVideoRequest, CreateVideoResponse, VideoRecord
+from models.video import CreateVideoRequest, CreateVideoResponse
 from services.video_service import create_video_task
-from services.supabase_service import create_initial_video_record, supabase_client
+from services.supabase_service import create_initial_video_record, supabase_http, close_supabase_http
 from core.config import settings
-from utils.file_utils import ensure_dir
+from utils.file_utils import ensure_dir, close_download_session
+from utils.ffmpeg_utils import select_video_encoder
+from utils.srt_utils import shutdown_srt_pool
 
 # --- Logging Setup --- 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# --- Startup / Shutdown (Lifespan) ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create working directories once per worker instead of on import / per request
+    ensure_dir(settings.output_dir)
+    ensure_dir(settings.temp_dir_base)
+    if settings.download_cache_max_mb > 0:
+        ensure_dir(settings.download_cache_dir)
+    # Create the pooled Supabase HTTP client up front so the first request doesn't pay for it
+    supabase_http()
+    # Probe the ffmpeg build once and cache the video encoder to use
+    await select_video_encoder()
+    yield
+    await close_supabase_http()
+    await close_download_session()
+    await asyncio.to_thread(shutdown_srt_pool) # Waits for workers without blocking the loop
+
 # --- FastAPI App Initialization --- 
-app = FastAPI(title="Video Generation Service")
+app = FastAPI(title="Video Generation Service", lifespan=lifespan)
 
 # --- Mount Static Files Directory (Optional) ---
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles that marks responses as immutable; generated videos never change once written."""
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, immutable, max-age=31536000"
+        return response
+
 # Serve files from the 'public' directory (where videos might be stored locally)
-ensure_dir(settings.output_dir) # Ensure the directory exists before mounting
-app.mount("/public", StaticFiles(directory=settings.output_dir), name="public")
+# check_dir=False: the directory is created in lifespan(), which runs after the mount is set up
+app.mount("/public", ImmutableStaticFiles(directory=settings.output_dir, html=False, check_dir=False), name="public")
 
 # --- Database Schema (Commented Out SQL) --- 
 # Ensure you have the uuid-ossp extension enabled in Supabase/Postgres:
@@ -66,31 +93,25 @@ async def create_video_endpoint(request: CreateVideoRequest, background_tasks: B
     """Accepts video creation requests and starts the process in the background."""
     logger.info(f"Received video creation request for user: {request.user_id}")
 
-    if not supabase_client:
+    if not supabase_http():
         logger.error("Supabase client is not initialized. Cannot process request.")
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
             detail="Video processing service is temporarily unavailable."
         )
 
-    if not request.image_urls:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Image URLs cannot be empty.")
-        
-    if len(request.image_urls) > 20: # Limit number of images
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot process more than 20 images.")
+    # Empty / more than 20 image URLs are rejected by CreateVideoRequest validation (422)
 
     # 1. Create an initial record in the database
-    video_record = VideoRecord(
-        user_id=request.user_id,
-        image_urls=[str(url) for url in request.image_urls], # Convert HttpUrl to str for DB
-        audio_url=str(request.audio_url),
-        status="pending" # Initial status
-    )
-    
-    # Use .dict() or .model_dump() depending on Pydantic version
-    # record_data = video_record.model_dump(exclude_unset=True) 
-    record_data = video_record.dict(exclude_unset=True) # For Pydantic v1
-    record_data['id'] = str(video_record.id) # Ensure UUID is string for Supabase insert if needed
+    # Built as a plain dict (same columns as VideoRecord) to skip model construction and serialization
+    new_id = str(uuid.uuid4()) # Formatted once; reused for the DB insert and the response
+    record_data = {
+        "id": new_id,
+        "user_id": request.user_id,
+        "image_urls": request.image_urls,
+        "audio_url": request.audio_url,
+        "status": "pending" # Initial status
+    }
 
     video_id = await create_initial_video_record(record_data)
 
@@ -108,8 +129,8 @@ async def create_video_endpoint(request: CreateVideoRequest, background_tasks: B
         create_video_task,
         video_id=video_id,
         user_id=request.user_id,
-        image_urls=[str(url) for url in request.image_urls], # Pass URLs as strings
-        audio_url=str(request.audio_url)
+        image_urls=request.image_urls,
+        audio_url=request.audio_url
     )
 
     logger.info(f"Video creation task for ID {video_id} added to background.")
@@ -117,12 +138,13 @@ async def create_video_endpoint(request: CreateVideoRequest, background_tasks: B
     # 3. Return acceptance response
     return CreateVideoResponse(
         message="Video creation started successfully. It will be processed in the background.",
-        video_id=video_record.id # Return the generated UUID
+        video_id=new_id # Return the generated UUID
     )
 
 # --- Uvicorn Runner (for local development) --- 
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting Uvicorn server...")
-    # Use reload=True for development to automatically reload on code changes
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # uvloop + httptools replace the pure-Python event loop and HTTP parser.
+    # Use reload=True for development to automatically reload on code changes (drop it in production)
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools", reload=True) 
\ No newline at end of file
@@ -1,20 +1,29 @@
-from pydantic import BaseModel, HttpUrl
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
+from typing import Annotated, List, Optional
 import uuid
 
+# URLs are only forwarded as strings, so a cheap regex check replaces HttpUrl's full parse + IDNA encoding
+UrlStr = Annotated[str, StringConstraints(pattern=r"^(?i:https?)://[^\s]+$", max_length=2048)]
+
 class CreateVideoRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     user_id: str # Assuming user ID is a string, adjust if it's UUID or int
-    image_urls: List[HttpUrl]
-    audio_url: HttpUrl
+    image_urls: Annotated[List[UrlStr], Field(min_length=1, max_length=20)] # Rejected during parsing if empty or over the limit
+    audio_url: UrlStr
 
 class CreateVideoResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     message: str
-    video_id: Optional[uuid.UUID] = None # Return the ID for potential status tracking
+    video_id: Optional[str] = None # Return the ID (UUID string) for potential status tracking
     error: Optional[str] = None
 
 # Optional: Model representing the database table structure
 class VideoRecord(BaseModel):
-    id: uuid.UUID = uuid.uuid4()
+    model_config = ConfigDict(frozen=True)
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4) # Fresh UUID per instance
     user_id: str
     image_urls: List[str] # Store as list of strings in DB
     audio_url: str
@@ -1,50 +1,86 @@
 import os
+import enum
 import logging
-from supabase import create_client, Client
+import aiofiles
+import httpx
+import orjson
 from core.config import settings
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
-def get_supabase_client() -> Optional[Client]:
-    """Initializes and returns a Supabase client instance."""
-    if not settings.supabase_url or not settings.supabase_key:
-        logger.error("Supabase URL or Key not configured. Cannot initialize client.")
-        return None
-    try:
-        client: Client = create_client(settings.supabase_url, settings.supabase_key)
-        logger.info("Supabase client initialized successfully.")
-        return client
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase client: {e}")
-        return None
+# Settings are immutable for the process lifetime, so the public URL prefix is built once
+_PUBLIC_URL_PREFIX = f"{settings.supabase_url}/storage/v1/object/public/{settings.supabase_bucket_name}/"
+# Request bodies are pre-encoded with orjson, so the content type is set explicitly
+_JSON_HEADERS = {"Content-Type": "application/json"}
 
-supabase_client = get_supabase_client()
+# Shared, connection-pooled client for Supabase REST (PostgREST) and Storage traffic.
+# Reusing it keeps TCP/TLS connections (and HTTP/2 streams) alive across DB and storage calls.
+_supabase_http: Optional[httpx.AsyncClient] = None
+
+def supabase_http() -> Optional[httpx.AsyncClient]:
+    """Returns the shared Supabase HTTP client, creating it on first use."""
+    global _supabase_http
+    if _supabase_http is None:
+        if not settings.supabase_url or not settings.supabase_key:
+            logger.error("Supabase URL or Key not configured. Cannot initialize client.")
+            return None
+        _supabase_http = httpx.AsyncClient(
+            base_url=settings.supabase_url,
+            headers={
+                "apikey": settings.supabase_key,
+                "Authorization": f"Bearer {settings.supabase_key}",
+            },
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20),
+            timeout=httpx.Timeout(30.0),
+        )
+        logger.info("Supabase HTTP client initialized successfully.")
+    return _supabase_http
+
+async def close_supabase_http():
+    """Closes the shared Supabase HTTP client and its pooled connections."""
+    global _supabase_http
+    if _supabase_http is not None:
+        await _supabase_http.aclose()
+        _supabase_http = None
+        logger.info("Supabase HTTP client closed.")
+
+async def _iter_file_chunks(file_path: str, chunk_size: int = 1 << 20):
+    """Yields a file's contents in fixed-size chunks so uploads never hold the whole file in memory."""
+    async with aiofiles.open(file_path, 'rb') as f:
+        while True:
+            chunk = await f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
 
 async def upload_to_supabase_storage(file_path: str, destination_path: str) -> Optional[str]:
-    """Uploads a file to Supabase Storage and returns the public URL."""
-    if not supabase_client:
+    """Streams a file to Supabase Storage and returns the public URL."""
+    client = supabase_http()
+    if not client:
         logger.error("Supabase client not available for storage upload.")
         return None
-    
+
     try:
         logger.info(f"Uploading {file_path} to Supabase Storage at {settings.supabase_bucket_name}/{destination_path}")
-        with open(file_path, 'rb') as f:
-            # Use upsert=True to overwrite if file exists (optional)
-            res = supabase_client.storage.from_(settings.supabase_bucket_name).upload(
-                path=destination_path,
-                file=f,
-                file_options={"content-type": "video/mp4", "upsert": "true"} 
-            )
-
-        print("*****************")
-        print(res)
-        print("*****************")
-        
-        if res.fullPath:
-             # Construct the public URL manually or use get_public_url if your bucket is public
-            public_url = f"{settings.supabase_url}/storage/v1/object/public/{settings.supabase_bucket_name}/{destination_path}"
-            # Or use: public_url = supabase_client.storage.from_(settings.supabase_bucket_name).get_public_url(destination_path)
+        headers = {
+            "Content-Type": "video/mp4",
+            "Content-Length": str(os.path.getsize(file_path)),
+            "x-upsert": "true", # Overwrite if file exists
+        }
+        res = await client.post(
+            f"/storage/v1/object/{settings.supabase_bucket_name}/{destination_path}",
+            content=_iter_file_chunks(file_path),
+            headers=headers,
+            timeout=None, # Large videos can take a while to upload
+        )
+
+        logger.debug("Storage upload response: %r", res)
+
+        if res.is_success:
+             # Construct the public URL manually (bucket is expected to be public)
+            public_url = _PUBLIC_URL_PREFIX + destination_path
             logger.info(f"✅ Successfully uploaded to Supabase Storage. Public URL: {public_url}")
             return public_url
         else:
@@ -54,46 +90,45 @@ async def upload_to_supabase_storage(file_path: str, destination_path: str) -> O
         logger.error(f"Error uploading file {file_path} to Supabase Storage: {e}")
         return None
 
+class _Unset(enum.Enum):
+    """Sentinel for "leave this column unchanged", so an explicit None can still clear a column."""
+    UNSET = enum.auto()
+
+_UNSET = _Unset.UNSET
+
 async def update_video_record_status(
-    video_id: str, 
-    status: str, 
-    final_video_url: Optional[str] = None, 
-    error_message: Optional[str] = None,
-    minutes_taken: Optional[float] = None
+    video_id: str,
+    status: str,
+    final_video_url: Optional[str] | _Unset = _UNSET,
+    error_message: Optional[str] | _Unset = _UNSET,
+    minutes_taken: Optional[float] | _Unset = _UNSET
 ):
     """Updates the status and potentially the final URL, error message, or minutes_taken of a video record in the database."""
-    if not supabase_client:
+    # Only send the columns the caller actually passed so we don't overwrite existing DB values unexpectedly
+    update_data = {"status": status}
+    if final_video_url is not _UNSET:
+        update_data["final_video_url"] = final_video_url
+    if error_message is not _UNSET:
+        update_data["error_message"] = error_message
+    if minutes_taken is not _UNSET:
+        update_data["minutes_taken"] = minutes_taken
+
+    client = supabase_http()
+    if not client:
         logger.error("Supabase client not available for database update.")
         return
 
-    update_data = {
-        "status": status,
-        "final_video_url": final_video_url,
-        "error_message": error_message,
-        "minutes_taken": minutes_taken
-    }
-    # Remove None values so they don't overwrite existing DB values unexpectedly
-    update_data = {k: v for k, v in update_data.items() if v is not None}
-
     try:
         logger.info(f"Updating video record {video_id} with data: {update_data}")
-        # Replace 'videos' with your actual table name
-        data, count = supabase_client.table('video_records')\
-                                    .update(update_data)\
-                                    .eq('id', video_id)\
-                                    .execute()
-        
-        # Check if the update was successful (depends on execute() return type/behavior)
-        # Supabase-py V1 might return a list like [[record], count] or similar
-        # Supabase-py V2 returns an APIResponse object
-        # Adjust error checking based on the version you are using
-        # Example for V2 (check if data is present in response):
-        # if not data or (isinstance(data, list) and not data[0]):
-        #     logger.warning(f"No record found or updated for video_id: {video_id}")
-        # else:
-        #     logger.info(f"Successfully updated video record {video_id}")
-        # Generic log for now:
-        logger.info(f"Database update response for {video_id}: Data={data}, Count={count}")
+        # Replace 'video_records' with your actual table name
+        res = await client.patch(
+            "/rest/v1/video_records",
+            params={"id": f"eq.{video_id}"},
+            content=orjson.dumps(update_data),
+            headers=_JSON_HEADERS,
+        )
+        res.raise_for_status()
+        logger.info(f"Database update response for {video_id}: Status={res.status_code}")
 
     except Exception as e:
         logger.error(f"Error updating video record {video_id} in database: {e}")
@@ -101,20 +136,26 @@ async def update_video_record_status(
 # Placeholder for creating the initial record (called from main.py)
 async def create_initial_video_record(video_data: dict) -> Optional[str]:
     """Creates an initial record in the database and returns the new record's ID."""
-    if not supabase_client:
+    client = supabase_http()
+    if not client:
         logger.error("Supabase client not available for database insert.")
         return None
     try:
         logger.info(f"Creating initial video record with data: {video_data}")
-        # Replace 'videos' with your actual table name
-        data, count = supabase_client.table('video_records').insert(video_data).execute()
-        
-        # Extract ID from the response data structure
-        print(type(data))
+        # Replace 'video_records' with your actual table name
+        res = await client.post(
+            "/rest/v1/video_records",
+            content=orjson.dumps(video_data),
+            headers={**_JSON_HEADERS, "Prefer": "return=representation"}, # Return the inserted row
+        )
+        res.raise_for_status()
+        data = orjson.loads(res.content)
 
+        # Extract ID from the response data structure
+        logger.debug("Insert response: %r", data)
 
-        if data and isinstance(data, tuple) and data[0]:
-            record_id = data[1][0]['id']  # Access the first record in the data array
+        if data and isinstance(data, list) and data[0].get('id'):
+            record_id = data[0]['id']  # Access the first record in the data array
             logger.info(f"Successfully created initial video record with ID: {record_id}")
             return str(record_id)  # Ensure it's returned as string if needed
         else:
@@ -123,4 +164,4 @@ async def create_initial_video_record(video_data: dict) -> Optional[str]:
 
     except Exception as e:
         logger.error(f"Error creating initial video record in database: {e}")
-        return None 
\ No newline at end of file
+        return None
\ No newline at end of file
@@ -1,15 +1,14 @@
 import os
 import uuid
 import asyncio
+import math
 import logging
-import aiofiles
-import shutil
 import time # Added for timing
 from typing import List
 
 from core.config import settings
-from utils.file_utils import ensure_dir, cleanup_dir, download_file, get_file_extension_from_url
-from utils.ffmpeg_utils import run_ffmpeg_async, get_media_duration
+from utils.file_utils import ensure_dir, cleanup_dir_async, download_file, download_files, move_file, get_file_extension_from_url
+from utils.ffmpeg_utils import run_ffmpeg_async, get_media_info, MediaInfo, select_video_encoder, video_encoder_args
 from services.supabase_service import update_video_record_status, upload_to_supabase_storage
 # New imports for subtitle processing
 from utils.transcription_utils import generate_srt_from_audio
@@ -33,51 +32,44 @@ async def create_video_task(
     # Paths for subtitle files
     initial_srt_path = os.path.join(temp_dir, f"subtitles_initial-{unique_suffix}.srt")
     reformatted_srt_path = os.path.join(temp_dir, f"subtitles_reformatted-{unique_suffix}.srt")
-    video_with_subs_path = "" # Will be set if subtitles are added
 
     try:
-        ensure_dir(temp_dir)
-        ensure_dir(settings.output_dir) # Ensure final output dir exists
+        ensure_dir(temp_dir) # Output dir and temp base are created once at app startup
         logger.info(f"[{video_id}] Starting video creation. Temp dir: {temp_dir}")
         await update_video_record_status(video_id, status="processing")
 
         # --- Download Files --- 
-        download_tasks = []
-        downloaded_image_paths = {}
-        downloaded_audio_path = None
-
-        # Download Images
-        for i, img_url in enumerate(image_urls):
-            ext = get_file_extension_from_url(img_url)
-            img_filename = f"image-{i}{ext}"
-            img_path = os.path.join(temp_dir, img_filename)
-            download_tasks.append(asyncio.create_task(download_file(img_url, img_path), name=f"img-{i}"))
-            downloaded_image_paths[f"img-{i}"] = img_path
-
-        # Download Audio
-        audio_ext = get_file_extension_from_url(audio_url)
-        audio_filename = f"audio{audio_ext}"
-        audio_path = os.path.join(temp_dir, audio_filename)
-        download_tasks.append(asyncio.create_task(download_file(audio_url, audio_path), name="audio"))
-        downloaded_audio_path = audio_path
-
-        results = await asyncio.gather(*download_tasks, return_exceptions=True)
-        
+        image_pairs = [
+            (img_url, os.path.join(temp_dir, f"image-{i}{get_file_extension_from_url(img_url)}"))
+            for i, img_url in enumerate(image_urls)
+        ]
+
+        # Download Audio, then probe its duration as soon as it lands (overlaps with the image downloads)
+        async def download_audio_and_probe() -> tuple[str, MediaInfo | None] | None:
+            audio_path = os.path.join(temp_dir, f"audio{get_file_extension_from_url(audio_url)}")
+            if not await download_file(audio_url, audio_path):
+                logger.error(f"[{video_id}] Failed to download audio: {audio_url}")
+                return None
+            return audio_path, await get_media_info(audio_path) # Duration + codec info, or None if ffprobe failed
+
+        # Failed downloads return False/None; only unexpected errors abort the group
+        try:
+            async with asyncio.TaskGroup() as tg:
+                images_task = tg.create_task(download_files(image_pairs, use_cache=True))
+                audio_task = tg.create_task(download_audio_and_probe())
+        except* Exception as eg:
+            raise eg.exceptions[0] # Surface the real error (not "unhandled errors in a TaskGroup") in the record
+
         successfully_downloaded_images = []
-        successfully_downloaded_audio = None
-        download_errors = []
-
-        for i, result in enumerate(results):
-            task_name = download_tasks[i].get_name()
-            if isinstance(result, Exception) or result is False:
-                error_msg = f"Failed to download {task_name}: {result if isinstance(result, Exception) else 'Unknown error'}"
-                logger.error(f"[{video_id}] {error_msg}")
-                download_errors.append(error_msg)
+        for (img_url, img_path), ok in zip(image_pairs, images_task.result()):
+            if ok:
+                successfully_downloaded_images.append(img_path)
             else:
-                if task_name.startswith("img-"):
-                    successfully_downloaded_images.append(downloaded_image_paths[task_name])
-                elif task_name == "audio":
-                    successfully_downloaded_audio = downloaded_audio_path
+                logger.error(f"[{video_id}] Failed to download image: {img_url}")
+        successfully_downloaded_audio = None
+        audio_info: MediaInfo | None = None
+        if audio_result := audio_task.result():
+            successfully_downloaded_audio, audio_info = audio_result
         
         if not successfully_downloaded_images:
             raise ValueError("Failed to download any images.")
@@ -88,10 +80,9 @@ async def create_video_task(
         if successfully_downloaded_audio:
              logger.info(f"[{video_id}] Successfully downloaded audio: {successfully_downloaded_audio}")
 
-        # --- Get Audio Duration --- 
-        audio_duration_seconds = None
+        # --- Audio Duration (probed right after the audio download) --- 
+        audio_duration_seconds = audio_info.duration if audio_info else None
         if successfully_downloaded_audio:
-            audio_duration_seconds = await get_media_duration(successfully_downloaded_audio)
             if audio_duration_seconds:
                 logger.info(f"[{video_id}] Detected audio duration: {audio_duration_seconds:.2f} seconds")
             else:
@@ -110,23 +101,31 @@ async def create_video_task(
             actual_zoom_duration = default_zoom_duration
             logger.info(f"[{video_id}] Using default durations - Slideshow: {actual_slideshow_duration:.2f}s, Zoom: {actual_zoom_duration:.2f}s")
 
-        # --- Video Processing Steps --- 
-        video_parts_to_concat = []
-        
-        # --- PART 1: Slideshow --- 
-        part1_filename = f"part1-{unique_suffix}.mp4"
-        part1_output_path = os.path.join(temp_dir, part1_filename)
+        # --- Video Processing: Single FFmpeg Pass ---
+        # Slideshow, zoom, concatenation and audio mux are fused into one filter graph,
+        # so the video is decoded/encoded exactly once and no intermediate MP4s are written.
+        filter_parts = [] # Chains joined with ';' into -filter_complex
+        ffmpeg_input_flags = [] # Stores the actual ffmpeg -i, -stream_loop flags and paths
+        current_ffmpeg_input_index = 0
+
+        # --- PART 1: Slideshow (Input 0) ---
         # Calculate duration per image based on the actual slideshow duration
         duration_per_image_part1 = actual_slideshow_duration / len(successfully_downloaded_images)
         duration_per_image_part1 = max(0.01, duration_per_image_part1) # Ensure positive duration
 
-        # Create file list for ffmpeg concat demuxer
-        filelist_content_part1 = "\n".join([f"file '{os.path.relpath(p, temp_dir).replace(os.sep, '/')}'\nduration {duration_per_image_part1:.6f}" for p in successfully_downloaded_images])
-        filelist_path_part1 = os.path.join(temp_dir, f"filelist_part1-{unique_suffix}.txt")
-        async with aiofiles.open(filelist_path_part1, 'w') as f:
-            await f.write(filelist_content_part1)
-        
-        # New VF for Part 1: Scale to cover 1024x720, then center crop
+        # Create file list for ffmpeg concat demuxer; it is fed through stdin, so paths must be absolute.
+        # Single quotes are escaped as '\'' per the concat syntax.
+        quoted_image_paths = [os.path.abspath(p).replace("'", "'\\''") for p in successfully_downloaded_images]
+        filelist_lines_part1 = ["file '%s'\nduration %.6f" % (p, duration_per_image_part1) for p in quoted_image_paths]
+        # The demuxer ignores the last entry's duration unless that file is listed once more
+        filelist_lines_part1.append("file '%s'" % quoted_image_paths[-1])
+        filelist_content_part1 = "\n".join(filelist_lines_part1)
+
+        slideshow_ffmpeg_index = current_ffmpeg_input_index
+        ffmpeg_input_flags.extend(['-f', 'concat', '-safe', '0', '-protocol_whitelist', 'pipe,file', '-i', 'pipe:0'])
+        current_ffmpeg_input_index += 1
+
+        # VF for Part 1: Scale to cover 1024x720, then center crop
         # Input images are 1792x1024. Target is 1024x720.
         # We need to scale so that the image covers the 1024x720 area, then crop.
         # scale=w='max(iw*target_h/ih,target_w)':h='max(target_h,ih*target_w/iw)'
@@ -146,38 +145,28 @@ async def create_video_task(
         vf_part1 = (
             f"scale='{settings.target_video_width}:{settings.target_video_height}:force_original_aspect_ratio=increase',"
             f"crop={settings.target_video_width}:{settings.target_video_height}:(iw-{settings.target_video_width})/2:(ih-{settings.target_video_height})/2,"
-            f"format=pix_fmts=yuv420p"
+            f"setsar=1,fps={settings.target_fps}" # Segments must agree on SAR/frame rate for the concat filter
         )
+        # No format= node in the graph: the encoder args set the output pixel format, converted once at the end
+        filter_parts.append(f"[{slideshow_ffmpeg_index}:v]{vf_part1}[v1]")
+        logger.info(f"[{video_id}] Part 1 (Slideshow - {actual_slideshow_duration:.2f}s) added to filter graph.")
 
-        ffmpeg_args_part1 = [
-            '-f', 'concat','-safe', '0','-i', filelist_path_part1,
-            '-vf', vf_part1, # Use the new cover & crop vf
-            '-r', str(settings.target_fps), '-y', part1_output_path # Removed -t, duration should be controlled by filelist
-        ]
-        success, _, stderr = await run_ffmpeg_async(ffmpeg_args_part1, f"[{video_id}] Part 1 (Slideshow)")
-        if not success:
-            raise RuntimeError(f"Failed to generate Part 1 (Slideshow): {stderr}")
-        video_parts_to_concat.append(part1_output_path)
-        logger.info(f"[{video_id}] Part 1 (Slideshow - {actual_slideshow_duration:.2f}s) generated: {part1_output_path}")
-
-        # --- PART 2: Zoom Effect on Last Image (Conditional) --- 
+        # --- PART 2: Zoom Effect on Last Image (Conditional, Input 1) ---
+        zoom_ffmpeg_index = -1
         if actual_zoom_duration > 0 and successfully_downloaded_images:
             last_image_path = successfully_downloaded_images[-1]
-            part2_filename = f"part2-{unique_suffix}.mp4"
-            part2_output_path = os.path.join(temp_dir, part2_filename)
-            
+
             # Check if high-quality zoom is enabled in settings
             use_hq_zoom = getattr(settings, 'use_high_quality_zoom', False)
-            
+
             if use_hq_zoom:
                 # High-quality alternating (ping-pong) zoom effect
                 logger.info(f"[{video_id}] Using high-quality alternating zoom effect.")
-                
+
                 # Get alternating zoom settings from config
-                input_fps = settings.hq_zoom_input_framerate # e.g., 25
                 output_fps = settings.hq_zoom_output_framerate # e.g., 25
                 initial_scale_width = settings.hq_zoom_initial_scale # e.g., 4000
-                
+
                 pingpong_increment = settings.hq_zoom_pingpong_increment # e.g., 0.0015
                 one_direction_duration_s = settings.hq_zoom_pingpong_duration_s # e.g., 20 seconds
                 max_zoom_factor = settings.hq_zoom_max_factor # e.g., 1.5
@@ -185,10 +174,10 @@ async def create_video_task(
 
                 one_direction_frames = int(one_direction_duration_s * output_fps)
                 full_cycle_frames = one_direction_frames * 2
-                
+
                 # Total frames for the entire zoom duration of this video part
                 total_duration_frames = int(actual_zoom_duration * output_fps)
-                
+
                 # Construct the z expression for zoompan
                 # 'on' is the output frame number, starting from 0
                 # 'zoom' is the zoom level from the previous frame (starts at 1.0)
@@ -197,96 +186,49 @@ async def create_video_task(
                     f"min(zoom+{pingpong_increment},{max_zoom_factor}),"
                     f"max(zoom-{pingpong_increment},{min_zoom_factor}))"
                 )
-                
+
                 zoom_pan_vf = (
                     f"scale={initial_scale_width}:-1," # Upscale width, maintain aspect ratio
-                    f"zoompan=z='{z_expression}':" 
-                    f"x='iw/2-(iw/zoom/2)':" 
-                    f"y='ih/2-(ih/zoom/2)':" 
+                    f"zoompan=z='{z_expression}':"
+                    f"x='iw/2-(iw/zoom/2)':"
+                    f"y='ih/2-(ih/zoom/2)':"
                     f"d={total_duration_frames}:" # Duration in frames for the entire output segment
                     f"s={settings.target_video_width}x{settings.target_video_height}:" # Output resolution
-                    f"fps={output_fps}," 
-                    f"format=pix_fmts=yuv420p"
+                    f"fps={output_fps},"
+                    f"fps={settings.target_fps}" # Match the slideshow frame rate for concat
                 )
-                
-                ffmpeg_args_part2 = [
-                    '-loop', '1',
-                    '-framerate', str(input_fps),
-                    '-i', last_image_path,
-                    '-vf', zoom_pan_vf,
-                    '-t', str(actual_zoom_duration), # Total duration of this zoom part
-                    '-c:v', 'libx264',
-                    '-preset', settings.ffmpeg_preset,
-                    '-crf', str(settings.ffmpeg_crf),
-                    '-y',
-                    part2_output_path
-                ]
             else:
                 # Original approach with sinusoidal zoom (default)
                 logger.info(f"[{video_id}] Using standard zoom effect")
                 zoom_cycle_duration_seconds = 15 # Keep zoom cycle speed
                 zoom_amplitude = 0.25 # Keep zoom amplitude
                 total_zoom_frames = int(actual_zoom_duration * settings.target_fps)
+                # Fold the constant part of the phase in Python so zoompan only evaluates sin(on*step) per frame
+                zoom_phase_step = 2 * math.pi / (settings.target_fps * zoom_cycle_duration_seconds)
 
                 zoom_pan_vf = (
                     f"scale=w='max(iw*{settings.target_video_height}/ih,{settings.target_video_width})':h='max({settings.target_video_height},ih*{settings.target_video_width}/iw)':force_original_aspect_ratio=increase," # Scale to cover
                     f"crop=w={settings.target_video_width}:h={settings.target_video_height}," # Crop to target
-                    f"zoompan=z='1+{zoom_amplitude}*sin(2*PI*on/({settings.target_fps}*{zoom_cycle_duration_seconds}))':" # Zoom expr
+                    f"zoompan=z='1+{zoom_amplitude}*sin(on*{zoom_phase_step:.10f})':" # Zoom expr
                     f"x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':" # Center expr
                     f"d={total_zoom_frames}:" # Duration in frames
                     f"s={settings.target_video_width}x{settings.target_video_height}:" # Output size
-                    f"fps={settings.target_fps}," # Output FPS for zoompan
-                    f"format=pix_fmts=yuv420p" # Ensure pixel format
+                    f"fps={settings.target_fps}" # Output FPS for zoompan
                 )
 
-                ffmpeg_args_part2 = [
-                    '-loop', '1',
-                    '-i', last_image_path,
-                    '-vf', zoom_pan_vf,
-                    '-t', str(actual_zoom_duration),
-                    '-r', str(settings.target_fps),
-                    '-y',
-                    part2_output_path
-                ]
-            
-            success, _, stderr = await run_ffmpeg_async(ffmpeg_args_part2, f"[{video_id}] Part 2 (Zoom Effect)")
-            if success:
-                 video_parts_to_concat.append(part2_output_path)
-                 logger.info(f"[{video_id}] Part 2 (Zoom Effect - {actual_zoom_duration:.2f}s) generated: {part2_output_path}")
-            else:
-                 # Log warning but continue, video will be shorter
-                 logger.warning(f"[{video_id}] Failed to generate Part 2 (Zoom Effect), proceeding without it. Error: {stderr}")
+            # A single (non-looped) still: zoompan emits exactly d frames from it, then the segment ends
+            zoom_ffmpeg_index = current_ffmpeg_input_index
+            ffmpeg_input_flags.extend(['-i', last_image_path])
+            current_ffmpeg_input_index += 1
+
+            filter_parts.append(f"[{zoom_ffmpeg_index}:v]{zoom_pan_vf},setsar=1[v2]")
+            filter_parts.append("[v1][v2]concat=n=2:v=1:a=0[vout]")
+            logger.info(f"[{video_id}] Part 2 (Zoom Effect - {actual_zoom_duration:.2f}s) added to filter graph.")
         else:
             logger.info(f"[{video_id}] Skipping Part 2 (Zoom Effect) as calculated duration is zero or negative.")
-        
-        # --- PART 3: Concatenate Video Parts (Intermediate Step) --- 
-        combined_video_no_audio_subs_filename = f"combined_no_audio_subs-{unique_suffix}.mp4"
-        combined_video_no_audio_subs_path = os.path.join(temp_dir, combined_video_no_audio_subs_filename)
+            filter_parts.append("[v1]null[vout]") # Slideshow alone is the full video
 
-        if len(video_parts_to_concat) == 1:
-            logger.info(f"[{video_id}] Only one video part, copying to intermediate path.")
-            shutil.copyfile(video_parts_to_concat[0], combined_video_no_audio_subs_path)
-        else:
-            logger.info(f"[{video_id}] Concatenating {len(video_parts_to_concat)} video parts.")
-            concat_list_content_intermediate = "\n".join([f"file '{os.path.relpath(p, temp_dir).replace(os.sep, '/')}'" for p in video_parts_to_concat])
-            concat_list_path_intermediate = os.path.join(temp_dir, f"concat_list_intermediate-{unique_suffix}.txt")
-            async with aiofiles.open(concat_list_path_intermediate, 'w') as f:
-                await f.write(concat_list_content_intermediate)
-            logger.debug(f"[{video_id}] Intermediate concat list:\n{concat_list_content_intermediate}")
-
-            ffmpeg_args_concat_intermediate = [
-                '-f', 'concat',
-                '-safe', '0',
-                '-i', concat_list_path_intermediate,
-                '-c', 'copy', # Fast concatenation if codecs match
-                '-y', # Add this flag to overwrite output without asking
-                combined_video_no_audio_subs_path
-            ]
-            success, _, stderr = await run_ffmpeg_async(ffmpeg_args_concat_intermediate, f"[{video_id}] Intermediate Concatenation")
-            if not success:
-                raise RuntimeError(f"Failed intermediate concatenation: {stderr}")
-
-        logger.info(f"[{video_id}] Intermediate combined video (no audio/subs): {combined_video_no_audio_subs_path}")
+        video_output_node = "[vout]"
 
         # --- NEW: SUBTITLE GENERATION AND PROCESSING (COMMENTED OUT) --- 
         generated_srt_ready_for_burn = False # Subtitles are disabled
@@ -307,11 +249,9 @@ async def create_video_task(
         #     logger.info(f"[{video_id}] No audio downloaded, skipping subtitle generation.")
         logger.info(f"[{video_id}] Subtitle generation and burning is currently commented out.")
 
-        # --- NEW: BURN SUBTITLES ONTO VIDEO (COMMENTED OUT) --- 
-        current_video_base_for_final_step = combined_video_no_audio_subs_path # Default to video without subs
+        # --- NEW: BURN SUBTITLES INTO THE FILTER GRAPH (COMMENTED OUT) --- 
         # if generated_srt_ready_for_burn: # This condition will now always be false
-        #     video_with_subs_path = os.path.join(temp_dir, f"video_with_subs-{unique_suffix}.mp4")
-        #     logger.info(f"[{video_id}] Burning subtitles from {reformatted_srt_path} onto {combined_video_no_audio_subs_path}")
+        #     logger.info(f"[{video_id}] Burning subtitles from {reformatted_srt_path}")
             
         #     font_file_path = os.path.abspath(settings.subtitle_font_file) 
         #     if not os.path.exists(font_file_path):
@@ -336,24 +276,14 @@ async def create_video_task(
             
         #     force_style_value = ",".join(style_parts)
         #     subtitle_filter_value = f"{base_subtitle_string}:force_style='{force_style_value}'"
+        #     filter_parts.append(f"{video_output_node}{subtitle_filter_value}[vsubs]")
+        #     video_output_node = "[vsubs]"
 
-        #     ffmpeg_args_burn_subs = [
-        #         '-i', combined_video_no_audio_subs_path,
-        #         '-vf', subtitle_filter_value,
-        #         '-c:a', 'copy',
-        #         '-c:v', 'libx264', '-preset', 'fast', '-crf', '23',
-        #         '-y', video_with_subs_path
-        #     ]
-        #     success, _, stderr = await run_ffmpeg_async(ffmpeg_args_burn_subs, f"[{video_id}] Burning Subtitles")
-        #     if success:
-        #         logger.info(f"[{video_id}] Subtitles burned successfully: {video_with_subs_path}")
-        #         current_video_base_for_final_step = video_with_subs_path
-        #     else:
-        #         logger.error(f"[{video_id}] Failed to burn subtitles. Error: {stderr}. Proceeding without hardcoded subtitles.")
-
-        # --- PART 4: Add Audio (and potentially other overlays like Dust) --- 
+        # --- PART 3: Add Audio (and potentially other overlays like Dust) --- 
         final_video_filename = f"video-{video_id}.mp4" # Use persistent ID in final name
         final_video_path_local = os.path.join(settings.output_dir, final_video_filename)
+        # Render inside temp_dir and move it into the (publicly served, immutable-cached) output dir only once complete
+        render_path = os.path.join(temp_dir, final_video_filename)
         
         # --- Overlay logic commented out ---
         # dust_overlay_video_path = os.path.join(os.getcwd(), settings.dust_overlay_file_name)
@@ -361,15 +291,6 @@ async def create_video_task(
         # if not dust_overlay_exists:
         #      logger.warning(f"[{video_id}] Dust overlay video not found at {dust_overlay_video_path}. Skipping overlay.")
 
-        # --- Corrected Input and Index Logic for FFmpeg --- 
-        ffmpeg_input_flags = [] # Stores the actual ffmpeg -i, -stream_loop flags and paths
-        current_ffmpeg_input_index = 0
-        
-        # Input 0: Main video
-        main_video_ffmpeg_index = current_ffmpeg_input_index
-        ffmpeg_input_flags.extend(['-i', current_video_base_for_final_step])
-        current_ffmpeg_input_index += 1
-        
         # Optional: Dust Overlay - Commented out
         overlay_ffmpeg_index = -1 # This will ensure overlay is not applied
         # if dust_overlay_exists:
@@ -386,51 +307,44 @@ async def create_video_task(
             ffmpeg_input_flags.extend(['-i', successfully_downloaded_audio])
             current_ffmpeg_input_index += 1
             logger.info(f"[{video_id}] Adding audio track (FFmpeg Input {audio_ffmpeg_index}): {successfully_downloaded_audio}")
-            
-        # --- Build Filter Complex and Maps using correct FFmpeg indices ---
-        filter_complex_string = ""
-        map_flags = []
-
-        video_output_node = f"[{main_video_ffmpeg_index}:v]"
 
         if overlay_ffmpeg_index != -1: # This block will now be skipped
-            filter_complex_string = (
+            filter_parts.append(
                 f"[{overlay_ffmpeg_index}:v]format=rgba,scale={settings.target_video_width}:{settings.target_video_height},setsar=1,colorchannelmixer=aa=1[overlay_scaled];"
                 f"{video_output_node}[overlay_scaled]blend=all_mode=screen:shortest=1[out_v]"
             )
             video_output_node = "[out_v]"
 
-        # Determine the correct video map label
-        final_video_map_label = ""
-        if filter_complex_string: # If a video filter complex is active
-            final_video_map_label = video_output_node # Should be like [out_v]
-        else: # No video filter complex active, map directly from input
-            final_video_map_label = f"{main_video_ffmpeg_index}:v" # Should be like 0:v
-
-        map_flags.extend(['-map', final_video_map_label])
+        # Hardware encoders may need the frames handed over (e.g. hwupload) at the end of the graph
+        video_encoder = await select_video_encoder()
+        if video_encoder.filter_suffix:
+            filter_parts.append(f"{video_output_node}{video_encoder.filter_suffix}[venc]")
+            video_output_node = "[venc]"
 
+        # --- Build Maps using correct FFmpeg indices ---
+        map_flags = ['-map', video_output_node]
         if audio_ffmpeg_index != -1:
             map_flags.extend(['-map', f"{audio_ffmpeg_index}:a"])
-        # else: pass # Assuming combined video has no audio we want
 
         # --- Assemble the final command list --- 
-        ffmpeg_command_final = list(ffmpeg_input_flags) # Start with input flags
-
-        if filter_complex_string:
-             ffmpeg_command_final.extend(['-filter_complex', filter_complex_string])
-
+        ffmpeg_command_final = list(video_encoder.global_args) # Global options (e.g. hardware device) go first
+        ffmpeg_command_final.extend(ffmpeg_input_flags)
+        ffmpeg_command_final.extend(['-filter_complex', ";".join(filter_parts)])
         ffmpeg_command_final.extend(map_flags) # Add map flags
 
-        # Add encoding parameters
-        encoding_flags = [
-            '-c:v', 'libx264',
-            '-preset', 'fast',
-            '-crf', '23',
-            '-pix_fmt', 'yuv420p',
-            '-c:a', 'aac',
-            '-b:a', '192k',
-            '-r', str(settings.target_fps),
-        ]
+        # Add encoding parameters (the only encode in the pipeline)
+        # A slideshow-only video is nothing but held stills, so libx264 can skip most of its motion search
+        is_slideshow_only = zoom_ffmpeg_index == -1
+        encoding_flags = video_encoder_args(
+            video_encoder, preset='fast', crf=23,
+            still_image_gop=settings.target_fps if is_slideshow_only else None
+        )
+        # Audio that is already AAC is stream-copied instead of being re-encoded
+        if audio_info and audio_info.codec == 'aac':
+            encoding_flags += ['-c:a', 'copy']
+        else:
+            encoding_flags += ['-c:a', 'aac', '-b:a', '192k']
+        encoding_flags += ['-r', str(settings.target_fps)]
         ffmpeg_command_final.extend(encoding_flags)
         
         # Add '-shortest' flag conditionally (before output)
@@ -439,23 +353,32 @@ async def create_video_task(
 
         # Add output file path (and -y flag before it)
         ffmpeg_command_final.append('-y') # Add this flag to overwrite output without asking
-        ffmpeg_command_final.append(final_video_path_local)
+        ffmpeg_command_final.append(render_path)
 
         # Log the final command for debugging
         logger.debug(f"[{video_id}] Executing FFmpeg command: {' '.join(ffmpeg_command_final)}")
 
-        success, _, stderr = await run_ffmpeg_async(ffmpeg_command_final, f"[{video_id}] Final Processing (Audio/Overlay)")
+        success, _, stderr = await run_ffmpeg_async(
+            ffmpeg_command_final,
+            f"[{video_id}] Render (Slideshow/Zoom/Audio)",
+            stdin_bytes=filelist_content_part1.encode('utf-8') # Slideshow concat manifest for 'pipe:0'
+        )
         if not success:
             # Log the command again on failure for easier debugging
             logger.error(f"[{video_id}] Failed FFmpeg command: {' '.join(ffmpeg_command_final)}")
-            raise RuntimeError(f"Failed final video processing: {stderr}")
+            raise RuntimeError(f"Failed video rendering: {stderr}")
 
+        await asyncio.to_thread(move_file, render_path, final_video_path_local)
         logger.info(f"[{video_id}] Final video generated locally: {final_video_path_local}")
 
         # --- Upload to Supabase Storage --- 
         # Commented out Supabase upload
         supabase_destination_path = f"user_{user_id}/{os.path.basename(final_video_path_local)}"
-        public_video_url = await upload_to_supabase_storage(final_video_path_local, supabase_destination_path)
+        # The video has already been moved out of temp_dir, so the temp files can be deleted while it uploads
+        public_video_url, _ = await asyncio.gather(
+            upload_to_supabase_storage(final_video_path_local, supabase_destination_path),
+            cleanup_dir_async(temp_dir),
+        )
 
         if not public_video_url:
             raise RuntimeError("Failed to upload final video to Supabase Storage.")
@@ -479,8 +402,8 @@ async def create_video_task(
         await update_video_record_status(video_id, status="failed", error_message=str(e))
 
     finally:
-        # --- Cleanup --- 
-        cleanup_dir(temp_dir)
+        # --- Cleanup --- (no-op if temp_dir was already removed alongside the upload)
+        await cleanup_dir_async(temp_dir)
         # Optionally remove local final video if only cloud storage is needed
         # if os.path.exists(final_video_path_local):
         #     try:
@@ -1,41 +1,133 @@
 import asyncio
+import os
+import shutil
 import logging
-import json # Added for potential future JSON parsing if needed
+from collections import deque
+import orjson
+from dataclasses import dataclass, field
+from core.config import settings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def run_ffmpeg_async(args: list[str], process_name: str) -> tuple[bool, str, str]:
-    """Runs an FFmpeg command asynchronously and returns success status, stdout, and stderr."""
+# Number of trailing output lines kept per stream; FFmpeg can emit thousands of progress lines per encode
+_FFMPEG_OUTPUT_TAIL_LINES = 200
+# Longer lines keep only their end; readline() would raise past the StreamReader's 64 KiB limit instead
+_FFMPEG_OUTPUT_MAX_LINE_BYTES = 8192
+
+async def _drain_stream(stream: asyncio.StreamReader, tail: deque):
+    """Reads a subprocess stream in chunks, keeping only the last (raw) lines in a bounded deque."""
+    partial = b""
+    while chunk := await stream.read(65536):
+        lines = (partial + chunk).split(b"\n")
+        partial = lines.pop()[-_FFMPEG_OUTPUT_MAX_LINE_BYTES:] # Incomplete last line, carried into the next chunk
+        tail.extend(line[-_FFMPEG_OUTPUT_MAX_LINE_BYTES:] + b"\n" for line in lines)
+    if partial:
+        tail.append(partial)
+
+async def _feed_stdin(stream: asyncio.StreamWriter, data: bytes):
+    """Writes data to a subprocess stdin and closes it so the reader sees EOF."""
+    try:
+        stream.write(data)
+        await stream.drain()
+        stream.close()
+    except (BrokenPipeError, ConnectionResetError):
+        # FFmpeg exited before reading its input (e.g. device setup failed); its exit code and stderr report why
+        pass
+
+def _build_cpu_sets(slots: int) -> list[str] | None:
+    """Splits the CPUs this process may use into one contiguous taskset list per FFmpeg slot."""
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    if shutil.which('taskset') is None:
+        logger.warning("FFMPEG_PIN_CPUS is enabled but taskset is not installed. CPU pinning is disabled.")
+        return None
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < slots:
+        return None
+    per_slot = len(cpus) // slots
+    return [",".join(map(str, cpus[i * per_slot:(i + 1) * per_slot])) for i in range(slots)]
+
+# Bounds concurrent FFmpeg processes so parallel jobs don't oversubscribe the cores.
+# The queue acts as a semaphore whose tokens are slot numbers, so each running render can own a CPU set.
+_FFMPEG_SLOTS: asyncio.Queue[int] = asyncio.Queue()
+for _slot in range(max(1, settings.ffmpeg_max_parallel)):
+    _FFMPEG_SLOTS.put_nowait(_slot)
+_FFMPEG_CPU_SETS = _build_cpu_sets(_FFMPEG_SLOTS.qsize()) if settings.ffmpeg_pin_cpus else None
+
+async def run_ffmpeg_async(args: list[str], process_name: str, stdin_bytes: bytes | None = None) -> tuple[bool, str, str]:
+    """
+    Runs an FFmpeg command asynchronously and returns success status, stdout, and stderr.
+    The output (last lines only) is returned on failure; on success both strings are empty.
+    If stdin_bytes is given it is piped to FFmpeg's stdin (e.g. a concat manifest read via 'pipe:0').
+    """
+    # Only errors are written: no banner, no per-frame status line and no progress reports to drain
+    args = ['-hide_banner', '-loglevel', 'error', '-nostats', *args]
     command_str = f"ffmpeg {' '.join(args)}"
-    logger.info(f"Starting FFmpeg for {process_name} with args: {command_str}")
-    
-    process = await asyncio.create_subprocess_exec(
-        'ffmpeg', *args,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
 
-    stdout_bytes, stderr_bytes = await process.communicate()
-    stdout = stdout_bytes.decode('utf-8', errors='ignore')
-    stderr = stderr_bytes.decode('utf-8', errors='ignore')
+    slot = await _FFMPEG_SLOTS.get()
+    try:
+        program = ['ffmpeg']
+        if _FFMPEG_CPU_SETS:
+            # x264 sizes its thread pool from the process affinity, so no -threads is needed
+            program = ['taskset', '-c', _FFMPEG_CPU_SETS[slot], 'ffmpeg']
+        logger.info(f"Starting FFmpeg for {process_name} (slot {slot}) with args: {command_str}")
 
-    log_output = f"\n--- STDOUT ---\n{stdout}\n--- STDERR ---\n{stderr}\n--------------"
+        process = await asyncio.create_subprocess_exec(
+            *program, *args,
+            stdin=asyncio.subprocess.PIPE if stdin_bytes is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        # Drain both pipes incrementally so output is never buffered in full (and the pipes never fill up)
+        stdout_tail = deque(maxlen=_FFMPEG_OUTPUT_TAIL_LINES)
+        stderr_tail = deque(maxlen=_FFMPEG_OUTPUT_TAIL_LINES)
+        io_tasks = [
+            _drain_stream(process.stdout, stdout_tail),
+            _drain_stream(process.stderr, stderr_tail),
+        ]
+        if stdin_bytes is not None:
+            io_tasks.append(_feed_stdin(process.stdin, stdin_bytes))
+        try:
+            await asyncio.gather(*io_tasks)
+            await process.wait()
+        except BaseException:
+            # Cancelled (or an I/O error): don't leave FFmpeg running unreaped and holding its slot's CPUs
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            raise
+    finally:
+        _FFMPEG_SLOTS.put_nowait(slot)
 
     if process.returncode == 0:
-        logger.info(f"FFmpeg process for {process_name} finished successfully (Code: 0). Output:{log_output}")
-        return True, stdout, stderr
-    else:
-        logger.error(f"FFmpeg process for {process_name} failed (Code: {process.returncode}). Output:{log_output}")
-        return False, stdout, stderr
-
-async def get_media_duration(file_path: str) -> float | None:
-    """Gets the duration of a media file in seconds using ffprobe."""
+        # The output is only needed to diagnose failures, so it is not decoded on success
+        logger.info(f"FFmpeg process for {process_name} finished successfully (Code: 0).")
+        return True, "", ""
+
+    stdout = b"".join(stdout_tail).decode('utf-8', errors='ignore')
+    stderr = b"".join(stderr_tail).decode('utf-8', errors='ignore')
+    log_output = f"\n--- STDOUT ---\n{stdout}\n--- STDERR ---\n{stderr}\n--------------"
+    logger.error(f"FFmpeg process for {process_name} failed (Code: {process.returncode}). Output:{log_output}")
+    return False, stdout, stderr
+
+@dataclass(frozen=True, slots=True)
+class MediaInfo:
+    """Container duration plus the first audio stream's properties, from a single ffprobe call."""
+    duration: float
+    codec: str | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+
+async def get_media_info(file_path: str) -> MediaInfo | None:
+    """Probes a media file with ffprobe (JSON output) and returns its duration and audio stream info."""
     args = [
         'ffprobe',
         '-v', 'error',             # Only show errors
-        '-show_entries', 'format=duration', # Request duration from format section
-        '-of', 'default=noprint_wrappers=1:nokey=1', # Output only the value
+        '-select_streams', 'a:0',  # Stream entries describe the first audio stream (skips cover art)
+        '-show_entries', 'format=duration:stream=codec_name,sample_rate,channels',
+        '-of', 'json',
         file_path
     ]
     command_str = f"ffprobe {' '.join(args)}"
@@ -48,17 +140,111 @@ async def get_media_duration(file_path: str) -> float | None:
     )
 
     stdout_bytes, stderr_bytes = await process.communicate()
-    stdout = stdout_bytes.decode('utf-8', errors='ignore').strip()
-    stderr = stderr_bytes.decode('utf-8', errors='ignore').strip()
 
-    if process.returncode == 0 and stdout:
-        try:
-            duration = float(stdout)
-            logger.info(f"Successfully obtained duration for {file_path}: {duration:.2f} seconds")
-            return duration
-        except ValueError:
-            logger.error(f"ffprobe returned non-numeric duration for {file_path}: '{stdout}'")
-            return None
-    else:
+    if process.returncode != 0:
+        stderr = stderr_bytes.decode('utf-8', errors='ignore').strip()
         logger.error(f"ffprobe failed for {file_path} (Code: {process.returncode}). Stderr: {stderr}")
-        return None 
\ No newline at end of file
+        return None
+
+    try:
+        probe = orjson.loads(stdout_bytes)
+        duration = float(probe['format']['duration'])
+    except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+        logger.error(f"ffprobe returned no usable duration for {file_path}: {stdout_bytes[:500]!r}")
+        return None
+
+    stream = (probe.get('streams') or [{}])[0]
+    sample_rate = stream.get('sample_rate') # ffprobe reports this as a string
+    info = MediaInfo(
+        duration=duration,
+        codec=stream.get('codec_name'),
+        sample_rate=int(sample_rate) if sample_rate else None,
+        channels=stream.get('channels'),
+    )
+    logger.info(f"Successfully probed {file_path}: {info.duration:.2f} seconds, codec={info.codec}")
+    return info
+
+@dataclass(frozen=True)
+class VideoEncoder:
+    """H.264 encoder backend and the extra FFmpeg arguments it needs."""
+    name: str # Value of settings.hw_encoder this profile belongs to
+    codec: str # FFmpeg encoder name, e.g. libx264 or h264_nvenc
+    global_args: list[str] = field(default_factory=list) # Placed before the inputs (e.g. device setup)
+    filter_suffix: str = "" # Appended to the final video node of the filter graph (e.g. hwupload)
+
+# Hardware backends selectable via settings.hw_encoder ("none" means software libx264)
+_HW_ENCODERS = {
+    "nvenc": VideoEncoder("nvenc", "h264_nvenc"),
+    "qsv": VideoEncoder("qsv", "h264_qsv"),
+    "vt": VideoEncoder("vt", "h264_videotoolbox"),
+    "vaapi": VideoEncoder(
+        "vaapi", "h264_vaapi",
+        global_args=['-vaapi_device', settings.vaapi_device],
+        filter_suffix="format=nv12,hwupload", # Frames must be uploaded to the VAAPI surface
+    ),
+}
+_SOFTWARE_ENCODER = VideoEncoder("none", "libx264")
+_selected_video_encoder: VideoEncoder | None = None
+
+async def list_ffmpeg_encoders() -> set[str]:
+    """Returns the names of the encoders the installed ffmpeg build supports."""
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-encoders',
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout_bytes, _ = await process.communicate()
+    encoders = set()
+    for line in stdout_bytes.decode('utf-8', errors='ignore').splitlines():
+        parts = line.split()
+        # Encoder lines look like: " V....D h264_nvenc   NVIDIA NVENC H.264 encoder"
+        if len(parts) >= 2 and len(parts[0]) == 6:
+            encoders.add(parts[1])
+    return encoders
+
+async def select_video_encoder() -> VideoEncoder:
+    """Picks the configured video encoder, falling back to libx264 if ffmpeg lacks it. Probed once per process."""
+    global _selected_video_encoder
+    if _selected_video_encoder is not None:
+        return _selected_video_encoder
+
+    requested = settings.hw_encoder.lower()
+    encoder = _SOFTWARE_ENCODER
+    if requested in _HW_ENCODERS:
+        candidate = _HW_ENCODERS[requested]
+        try:
+            available = await list_ffmpeg_encoders()
+        except Exception as e:
+            logger.warning(f"Could not probe ffmpeg encoders: {e}")
+            available = set()
+        if candidate.codec in available:
+            encoder = candidate
+        else:
+            logger.warning(f"Requested hardware encoder '{requested}' ({candidate.codec}) is not available. Falling back to libx264.")
+    elif requested != "none":
+        logger.warning(f"Unknown HW_ENCODER value '{settings.hw_encoder}'. Falling back to libx264.")
+
+    logger.info(f"Using video encoder: {encoder.codec}")
+    _selected_video_encoder = encoder
+    return encoder
+
+def video_encoder_args(encoder: VideoEncoder, preset: str, crf: int, still_image_gop: int | None = None) -> list[str]:
+    """
+    Returns the -c:v/quality/pixel-format output arguments for the given encoder.
+    still_image_gop tunes libx264 for held still frames (no motion search effort, one keyframe per GOP).
+    """
+    if encoder.codec == "h264_nvenc":
+        return ['-c:v', 'h264_nvenc', '-preset', 'p4', '-rc', 'vbr', '-cq', str(crf), '-b:v', '0', '-pix_fmt', 'yuv420p']
+    if encoder.codec == "h264_qsv":
+        return ['-c:v', 'h264_qsv', '-global_quality', str(crf), '-pix_fmt', 'nv12']
+    if encoder.codec == "h264_videotoolbox":
+        # VideoToolbox has no CRF mode; use a fixed bitrate suitable for 720p
+        return ['-c:v', 'h264_videotoolbox', '-b:v', '5M', '-pix_fmt', 'yuv420p']
+    if encoder.codec == "h264_vaapi":
+        return ['-c:v', 'h264_vaapi', '-qp', str(crf)] # Pixel format is set by the hwupload filter
+    if still_image_gop:
+        return [
+            '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'stillimage', '-g', str(still_image_gop),
+            '-crf', str(crf), '-x264-params', 'scenecut=0:ref=1:bframes=0', '-pix_fmt', 'yuv420p',
+        ]
+    return ['-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p']
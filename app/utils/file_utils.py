@@ -1,28 +1,75 @@
 import aiohttp
-import aiofiles
+import asyncio
+import hashlib
 import os
+import uuid
+import errno
 import shutil
+import tempfile
+import threading
+import time
 import logging
 from typing import Optional
-from urllib.parse import urlparse
+from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Download bodies up to this size are held in memory and written in one go; larger ones are streamed to disk
+_DOWNLOAD_BUFFER_MAX_BYTES = 8 << 20
+
+def _blocking_write_file(filepath: str, data: bytes):
+    with open(filepath, 'wb') as f:
+        f.write(data)
+
+# Shared, connection-pooled session for all downloads, so repeated hosts reuse keep-alive connections and cached DNS
+_SESSION: Optional[aiohttp.ClientSession] = None
+
+async def _get_session() -> aiohttp.ClientSession:
+    """Returns the shared download session, creating it on first use."""
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=8, ttl_dns_cache=300, keepalive_timeout=30),
+            # No overall deadline (large media can legitimately take minutes); only a stalled connection times out
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60),
+        )
+    return _SESSION
+
+async def close_download_session():
+    """Closes the shared download session and its pooled connections."""
+    global _SESSION
+    if _SESSION is not None:
+        await _SESSION.close()
+        _SESSION = None
+
 async def download_file(url: str, filepath: str) -> bool:
     """Downloads a file asynchronously from a URL to a local path."""
     logger.info(f"Attempting to download from: {url} to {filepath}")
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                response.raise_for_status()  # Raise an exception for bad status codes
-                async with aiofiles.open(filepath, mode='wb') as f:
-                    while True:
-                        chunk = await response.content.read(1024) # Read in chunks
-                        if not chunk:
-                            break
-                        await f.write(chunk)
-                logger.info(f"Successfully downloaded and saved file to: {filepath}")
-                return True
+        session = await _get_session()
+        async with session.get(url) as response:
+            response.raise_for_status()  # Raise an exception for bad status codes
+            # Small bodies are buffered and written with a single thread hop instead of one per chunk;
+            # past the threshold the buffer is flushed and the rest is streamed to the file
+            buf = bytearray()
+            outfile = None
+            try:
+                async for chunk in response.content.iter_chunked(1 << 20): # Up to 1 MiB per read
+                    buf += chunk
+                    if len(buf) >= _DOWNLOAD_BUFFER_MAX_BYTES:
+                        if outfile is None:
+                            outfile = await asyncio.to_thread(open, filepath, 'wb')
+                        await asyncio.to_thread(outfile.write, buf)
+                        buf = bytearray()
+                if outfile is None:
+                    await asyncio.to_thread(_blocking_write_file, filepath, buf)
+                elif buf:
+                    await asyncio.to_thread(outfile.write, buf)
+            finally:
+                if outfile is not None:
+                    await asyncio.to_thread(outfile.close)
+        logger.info(f"Successfully downloaded and saved file to: {filepath}")
+        return True
     except aiohttp.ClientError as e:
         logger.error(f"Error downloading file {url}: {e}")
         return False
@@ -30,27 +77,196 @@ async def download_file(url: str, filepath: str) -> bool:
         logger.error(f"An unexpected error occurred during download of {url}: {e}")
         return False
 
+def _download_cache_path(url: str) -> str:
+    """Content-addressed cache location for a URL."""
+    return os.path.join(settings.download_cache_dir, hashlib.blake2b(url.encode(), digest_size=16).hexdigest())
+
+def _link_or_copy(src: str, dst: str):
+    """Hardlinks src to dst (no bytes copied), falling back to a copy across filesystems."""
+    try:
+        os.link(src, dst)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def _blocking_use_cached(cache_path: str, filepath: str) -> bool:
+    """Places a cached file at filepath; returns False on a cache miss."""
+    try:
+        os.utime(cache_path) # Mark as recently used; atime alone is unreliable on relatime mounts
+        _link_or_copy(cache_path, filepath)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _blocking_store_cached(tmp_path: str, cache_path: str, filepath: str):
+    """Links a fresh download into place, then publishes it to the cache and evicts old entries if it is over its limit."""
+    _link_or_copy(tmp_path, filepath)
+    size = os.stat(tmp_path).st_size
+    os.replace(tmp_path, cache_path) # Atomic: concurrent readers see either no entry or a complete one
+    _account_download_cache_store(size)
+
+# Running estimate of the cache size, so a miss only rescans the directory once the limit is crossed
+_cache_bytes: Optional[int] = None
+_cache_bytes_lock = threading.Lock() # Stores run concurrently in worker threads
+# In-flight downloads keep writing to their .tmp file; one untouched for this long was orphaned by a crash/cancel
+_STALE_TMP_SECONDS = 3600
+
+def _account_download_cache_store(size: int):
+    global _cache_bytes
+    max_bytes = settings.download_cache_max_mb * 1024 * 1024
+    with _cache_bytes_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += size
+            if _cache_bytes <= max_bytes:
+                return
+        # First store since startup, or over the limit: rescan (and evict) to get an exact total
+        _cache_bytes = _blocking_evict_download_cache(max_bytes)
+
+def _blocking_evict_download_cache(max_bytes: int) -> int:
+    """
+    Once the cache exceeds max_bytes, removes least recently used entries down to 90% of it
+    (so the next few stores don't trigger another scan). Also deletes orphaned .tmp files.
+    Returns the resulting cache size in bytes.
+    """
+    entries = []
+    total_bytes = 0
+    stale_tmp_before = time.time() - _STALE_TMP_SECONDS
+    with os.scandir(settings.download_cache_dir) as it:
+        for entry in it:
+            try:
+                stat = entry.stat()
+                if entry.name.endswith('.tmp'):
+                    if stat.st_mtime < stale_tmp_before:
+                        os.remove(entry.path)
+                    continue # Otherwise an in-flight download
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+            total_bytes += stat.st_size
+
+    if total_bytes <= max_bytes:
+        return total_bytes
+    target_bytes = max_bytes * 9 // 10
+    entries.sort()
+    for _, size, path in entries:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+        if total_bytes <= target_bytes:
+            break
+    return total_bytes
+
+async def download_cached(url: str, filepath: str) -> bool:
+    """
+    Like download_file, but serves repeated URLs from an on-disk cache (settings.download_cache_dir).
+    Hits are hardlinked into filepath, so no bytes are transferred or copied.
+    Cache errors never fail the download; they fall back to fetching the URL directly.
+    """
+    if settings.download_cache_max_mb <= 0:
+        return await download_file(url, filepath)
+
+    cache_path = _download_cache_path(url)
+    try:
+        if await asyncio.to_thread(_blocking_use_cached, cache_path, filepath):
+            logger.info(f"Download cache hit for {url}; linked to {filepath}")
+            return True
+    except OSError as e:
+        logger.warning(f"Download cache lookup failed for {url}, downloading directly: {e}")
+
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp" # Unique per download so concurrent misses don't collide
+    try:
+        if not await download_file(url, tmp_path):
+            return False
+        await asyncio.to_thread(_blocking_store_cached, tmp_path, cache_path, filepath)
+        return True
+    except OSError as e:
+        logger.warning(f"Error storing {url} in the download cache: {e}")
+        if os.path.exists(filepath):
+            return True
+        try:
+            os.replace(tmp_path, filepath) # Still use the download, just without caching it
+            return True
+        except OSError:
+            return False
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+async def download_files(pairs: list[tuple[str, str]], concurrency: int = 16, use_cache: bool = False) -> list[bool]:
+    """
+    Downloads (url, filepath) pairs concurrently, at most `concurrency` at a time.
+    Returns one success flag per pair, in order.
+    """
+    download = download_cached if use_cache else download_file
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one(url: str, filepath: str) -> bool:
+        async with semaphore:
+            return await download(url, filepath)
+
+    return await asyncio.gather(*(_one(url, filepath) for url, filepath in pairs))
+
 def ensure_dir(dir_path: str):
     """Ensures that a directory exists, creating it if necessary."""
-    if not os.path.exists(dir_path):
-        os.makedirs(dir_path, exist_ok=True)
-        logger.info(f"Created directory: {dir_path}")
+    os.makedirs(dir_path, exist_ok=True)
 
 def cleanup_dir(dir_path: str):
-    """Removes a directory and its contents."""
-    if os.path.exists(dir_path) and os.path.isdir(dir_path):
+    """Removes a directory and its contents; a missing directory is not an error."""
+    shutil.rmtree(dir_path, ignore_errors=True)
+
+async def cleanup_dir_async(dir_path: str):
+    """Removes a directory tree in a worker thread so large trees don't block the event loop."""
+    await asyncio.to_thread(cleanup_dir, dir_path)
+
+def move_file(src: str, dst: str):
+    """
+    Moves a file into place atomically. Same-filesystem moves are a metadata-only rename;
+    across filesystems the bytes are copied to a sibling temp file first, so readers never see a partial dst.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Hidden name so a partial copy is never listed or served from the output directory
+        fd, tmp_dst = tempfile.mkstemp(dir=os.path.dirname(dst) or ".", prefix=".")
+        os.close(fd)
         try:
-            shutil.rmtree(dir_path)
-            logger.info(f"Successfully removed temporary directory: {dir_path}")
-        except OSError as e:
-            logger.error(f"Error removing directory {dir_path}: {e}")
+            shutil.copyfile(src, tmp_dst, follow_symlinks=False)
+            shutil.copymode(src, tmp_dst) # mkstemp creates the file 0600
+            os.replace(tmp_dst, dst)
+        except BaseException:
+            try:
+                os.remove(tmp_dst)
+            except OSError:
+                pass
+            raise
+        os.remove(src)
 
 def get_file_extension_from_url(url: str) -> str:
     """Extracts the file extension from a URL, defaulting to .jpg."""
-    try:
-        parsed_path = urlparse(url).path
-        _, ext = os.path.splitext(parsed_path)
-        return ext if ext else '.jpg'
-    except Exception:
-        logger.warning(f"Could not parse URL to get extension: {url}. Defaulting to .jpg")
-        return '.jpg' 
\ No newline at end of file
+    # Plain string scans instead of urlparse + splitext: strip the query/fragment,
+    # skip scheme://host, then take the last dot of the final path segment
+    cut = url.find('?')
+    if cut != -1:
+        url = url[:cut]
+    cut = url.find('#')
+    if cut != -1:
+        url = url[:cut]
+    scheme = url.find('://')
+    path_start = url.find('/', scheme + 3 if scheme != -1 else 0)
+    if path_start == -1:
+        return '.jpg'
+    name_start = url.rfind('/') + 1
+    cut = url.find(';', name_start) # ;params on the last segment
+    if cut != -1:
+        url = url[:cut]
+    dot = url.rfind('.')
+    if dot > name_start and url[name_start:dot].strip('.'): # Leading dots don't start an extension (as in splitext)
+        return url[dot:]
+    return '.jpg'
\ No newline at end of file
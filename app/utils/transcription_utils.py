@@ -7,6 +7,16 @@ from core.config import settings # Import settings
 
 # Ensure OPENAI_API_KEY is set in your environment variables
 
+# Shared client: keeps its HTTP connection pool alive across transcriptions (the SDK client is thread-safe)
+_client: OpenAI | None = None
+
+def _get_client() -> OpenAI:
+    """Returns the shared OpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=settings.openai_api_key) # Use API key from settings
+    return _client
+
 def _blocking_transcribe_and_save_openai(audio_path: str, output_srt_path: str, model_name: str = "whisper-1") -> bool:
     """
     Performs audio transcription using the OpenAI API (whisper-1 model)
@@ -14,7 +24,7 @@ def _blocking_transcribe_and_save_openai(audio_path: str, output_srt_path: str,
     This is a blocking function and should be run in a thread.
     """
     try:
-        client = OpenAI(api_key=settings.openai_api_key) # Use API key from settings
+        client = _get_client()
         # logger.info(f"Starting OpenAI transcription for: {audio_path} using model {model_name}")
         
         with open(audio_path, "rb") as audio_file_object:
@@ -31,8 +41,14 @@ def _blocking_transcribe_and_save_openai(audio_path: str, output_srt_path: str,
             print(f"OpenAI transcription did not return a string for SRT format. Got: {type(transcription_response)}")
             return False
 
-        with open(output_srt_path, 'w', encoding='utf-8') as srtFile:
-            srtFile.write(transcription_response)
+        # Single-shot write straight to the fd (no Python file object or buffering layer)
+        data = memoryview(transcription_response.encode('utf-8'))
+        fd = os.open(output_srt_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while data: # os.write may write fewer bytes than requested
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
         
         # logger.info(f"SRT file from OpenAI API generated successfully: {output_srt_path}")
         return True